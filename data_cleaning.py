@@ -1,107 +1,133 @@
 # data_cleaning.py
 
 import sys
+import csv
 import pandas as pd
-import numpy as np
-from tqdm import tqdm
+import polars as pl
+
+# Raw column -> clean column name (adjust as needed)
+RENAME_MAP = {
+    "[QUOTE_DATE]": "quote_date",
+    "[EXPIRE_DATE]": "expire_date",
+    "[UNDERLYING_LAST]": "underlying_last",
+    "[STRIKE]": "strike",
+    "[C_IV]": "c_iv",
+    "[P_IV]": "p_iv",
+    "[C_BID]": "c_bid",
+    "[C_ASK]": "c_ask",
+    "[P_BID]": "p_bid",
+    "[P_ASK]": "p_ask",
+    "[DTE]": "dte"
+}
+
+# Schema of the long-format result (used as-is when there are no IV columns)
+LONG_SCHEMA = {
+    "quote_date": pl.Date,
+    "expire_date": pl.Date,
+    "underlying_last": pl.Float32,
+    "strike": pl.Float32,
+    "iv": pl.Float32,
+    "bid": pl.Float32,
+    "ask": pl.Float32,
+    "dte": pl.Float32,
+    "option_type": pl.String,
+    "mid_price": pl.Float32,
+    "time_to_expiry_years": pl.Float32,
+}
+
+def _read_header(csv_path: str) -> list:
+    """Returns the raw (unstripped) column names of the CSV."""
+    with open(csv_path, "r", newline="") as f:
+        return next(csv.reader(f))
+
+def _clean_options_lazy(csv_path: str) -> pl.LazyFrame:
+    """
+    Builds the lazy Polars plan that reads the raw CSV, merges calls & puts if
+    present, and yields the long format with columns:
+      ['quote_date', 'expire_date', 'underlying_last', 'strike', 'iv', 'bid',
+       'ask', 'dte', 'option_type', 'mid_price', 'time_to_expiry_years'].
+    Nothing is read until the plan is collected or sunk.
+    """
+    # 1) Map the (possibly padded) raw headers to clean names
+    rename_map = {
+        raw: RENAME_MAP[raw.strip()]
+        for raw in _read_header(csv_path)
+        if raw.strip() in RENAME_MAP
+    }
+    present = set(rename_map.values())
+
+    # 2) Read only the used columns (the select is pushed down into the scan)
+    #    as text, then strip & convert (unparseable -> null). Quotes, IVs and
+    #    DTE carry well under 7 significant digits, so float32 is enough.
+    lf = (
+        pl.scan_csv(csv_path, schema_overrides={raw: pl.String for raw in rename_map})
+        .select(list(rename_map))
+        .rename(rename_map)
+        .with_columns(
+            [pl.col(c).str.strip_chars().str.to_date("%Y-%m-%d", strict=False)
+             for c in ("quote_date", "expire_date") if c in present]
+            + [pl.col(c).str.strip_chars().cast(pl.Float32, strict=False)
+               for c in rename_map.values() if c not in ("quote_date", "expire_date")]
+        )
+    )
+
+    # 3) One lazy leg per option type, stacked vertically
+    legs = []
+    for prefix, option_type in (("c", "C"), ("p", "P")):
+        if f"{prefix}_iv" in present:
+            legs.append(lf.select(
+                "quote_date", "expire_date", "underlying_last", "strike",
+                pl.col(f"{prefix}_iv").alias("iv"),
+                pl.col(f"{prefix}_bid").alias("bid"),
+                pl.col(f"{prefix}_ask").alias("ask"),
+                "dte",
+                pl.lit(option_type).alias("option_type"),
+            ))
+    if not legs:
+        return pl.LazyFrame(schema=LONG_SCHEMA)
+
+    # 4) Mid-price, time to expiry, filter and (stable) sort
+    return (
+        pl.concat(legs, how="vertical")
+        .with_columns(
+            ((pl.col("bid") + pl.col("ask")) * 0.5).alias("mid_price"),
+            (pl.col("dte") / 365.0).alias("time_to_expiry_years"),
+        )
+        .drop_nulls(["quote_date", "expire_date", "strike", "underlying_last",
+                     "time_to_expiry_years"])
+        .filter(pl.col("time_to_expiry_years") > 0)
+        .sort(["quote_date", "expire_date", "strike", "option_type"], maintain_order=True)
+    )
 
 def load_and_clean_options(csv_path: str, chunksize=100_000) -> pd.DataFrame:
     """
-    Reads the raw CSV in chunks (with a progress bar), merges calls & puts if present,
-    and returns a DataFrame with columns:
-      ['quote_date', 'expire_date', 'option_type', 'strike', 'underlying_last',
-       'iv', 'mid_price', 'time_to_expiry_years'].
+    Runs the cleaning plan with the streaming engine and returns the long-format
+    result as a pandas DataFrame.
 
     :param csv_path: Path to the raw CSV file.
-    :param chunksize: Number of rows to read per chunk. Adjust as needed.
+    :param chunksize: Number of rows per streaming chunk. Adjust as needed.
     """
-    # 1) We'll read the file in chunks to show a progress bar if it's large
-    chunks = []
-    with pd.read_csv(csv_path, low_memory=True, chunksize=chunksize) as reader:
-        for chunk in tqdm(reader, desc="Reading CSV in chunks"):
-            chunks.append(chunk)
-    
-    # 2) Concatenate all chunks into one DataFrame
-    df = pd.concat(chunks, ignore_index=True)
-    
-    # 3) Strip whitespace from column names
-    df.columns = df.columns.str.strip()
-
-    # 4) Example rename (adjust as needed)
-    rename_map = {
-        "[QUOTE_DATE]": "quote_date",
-        "[EXPIRE_DATE]": "expire_date",
-        "[UNDERLYING_LAST]": "underlying_last",
-        "[STRIKE]": "strike",
-        "[C_IV]": "c_iv",
-        "[P_IV]": "p_iv",
-        "[C_BID]": "c_bid",
-        "[C_ASK]": "c_ask",
-        "[P_BID]": "p_bid",
-        "[P_ASK]": "p_ask",
-        "[DTE]": "dte"
-    }
-    for old_col, new_col in rename_map.items():
-        if old_col in df.columns:
-            df.rename(columns={old_col: new_col}, inplace=True)
-
-    # 5) Convert date cols to datetime
-    for col in ["quote_date", "expire_date"]:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors="coerce")
-
-    # 6) Convert numeric cols
-    for col in ["strike", "underlying_last", "c_iv", "p_iv", "c_bid", "c_ask", "p_bid", "p_ask", "dte"]:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    # 7) Construct calls DataFrame
-    calls = pd.DataFrame(columns=["quote_date", "expire_date", "underlying_last",
-                                  "strike","iv","bid","ask","dte","option_type"])
-    if "c_iv" in df.columns:
-        calls = df[[
-            "quote_date", "expire_date", "underlying_last", "strike",
-            "c_iv", "c_bid", "c_ask", "dte"
-        ]].copy()
-        calls["option_type"] = "C"
-        calls.rename(columns={
-            "c_iv": "iv",
-            "c_bid": "bid",
-            "c_ask": "ask"
-        }, inplace=True)
-
-    # 8) Construct puts DataFrame
-    puts = pd.DataFrame(columns=["quote_date", "expire_date", "underlying_last",
-                                 "strike","iv","bid","ask","dte","option_type"])
-    if "p_iv" in df.columns:
-        puts = df[[
-            "quote_date", "expire_date", "underlying_last", "strike",
-            "p_iv", "p_bid", "p_ask", "dte"
-        ]].copy()
-        puts["option_type"] = "P"
-        puts.rename(columns={
-            "p_iv": "iv",
-            "p_bid": "bid",
-            "p_ask": "ask"
-        }, inplace=True)
-
-    # 9) Combine
-    long_df = pd.concat([calls, puts], ignore_index=True)
-    long_df.sort_values(by=["quote_date", "expire_date", "strike", "option_type"], inplace=True)
-    long_df.reset_index(drop=True, inplace=True)
-
-    # 10) Compute mid-price
-    long_df["mid_price"] = 0.5 * (long_df["bid"] + long_df["ask"])
-
-    # 11) Convert dte to time_to_expiry_years
-    long_df["time_to_expiry_years"] = long_df["dte"] / 365.0
-
-    # 12) Filter out nonsense
-    long_df.dropna(subset=["quote_date", "expire_date", "strike", "underlying_last", 
-                           "time_to_expiry_years"], inplace=True)
-    long_df = long_df[long_df["time_to_expiry_years"] > 0]
-
-    return long_df
+    with pl.Config(streaming_chunk_size=chunksize):
+        df_long = _clean_options_lazy(csv_path).collect(engine="streaming")
+    return df_long.to_pandas()
+
+def clean_options_to_file(csv_path: str, out_path: str, chunksize=100_000) -> None:
+    """
+    Runs the cleaning plan in streaming mode and sinks the long-format result
+    straight to out_path, so neither the raw nor the cleaned frame is ever
+    fully held in memory.
+
+    :param csv_path: Path to the raw CSV file.
+    :param out_path: Path of the cleaned file to write; Parquet (zstd) if it ends
+                     in .parquet, CSV otherwise.
+    :param chunksize: Number of rows per streaming chunk. Adjust as needed.
+    """
+    lf_long = _clean_options_lazy(csv_path)
+    with pl.Config(streaming_chunk_size=chunksize):
+        if out_path.endswith(".parquet"):
+            lf_long.sink_parquet(out_path, compression="zstd")
+        else:
+            lf_long.sink_csv(out_path)
 
 def main():
     if len(sys.argv) < 2:
@@ -109,11 +135,10 @@ def main():
         sys.exit(1)
 
     in_csv = sys.argv[1]
-    out_csv = "options_cleaned.csv"
+    out_path = "options_cleaned.parquet"
 
-    df_clean = load_and_clean_options(in_csv, chunksize=100_000)
-    df_clean.to_csv(out_csv, index=False)
-    print(f"\nSaved cleaned data to {out_csv}, shape={df_clean.shape}")
+    clean_options_to_file(in_csv, out_path, chunksize=100_000)
+    print(f"\nSaved cleaned data to {out_path}")
 
 if __name__ == "__main__":
     main()
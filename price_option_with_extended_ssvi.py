@@ -1,48 +1,69 @@
 # price_option_with_extended_ssvi.py
 
 import sys
+import time
 import pandas as pd
 import numpy as np
 import yfinance as yf
-from math import log, sqrt, exp
-from scipy.stats import norm
-from datetime import datetime
+from scipy.special import ndtr
+from functools import lru_cache
+from ssvi_core import extended_ssvi_slice
 
 def black_scholes_price(S, K, T, r, sigma, option_type="C"):
-    if T <= 0:
-        # immediate expiry => intrinsic
-        if option_type.upper() == "C":
-            return max(S - K, 0.0)
-        else:
-            return max(K - S, 0.0)
-    d1 = (np.log(S/K) + (r + 0.5*sigma**2)*T) / (sigma*sqrt(T))
-    d2 = d1 - sigma*sqrt(T)
-    if option_type.upper() == "C":
-        return S*norm.cdf(d1) - K*exp(-r*T)*norm.cdf(d2)
-    else:
-        return K*exp(-r*T)*norm.cdf(-d2) - S*norm.cdf(-d1)
+    """
+    Black–Scholes price; S, K, T, sigma and option_type ("C"/"P") may be
+    scalars or broadcastable arrays. Options with T <= 0 are worth intrinsic.
+    """
+    is_call = np.char.upper(np.asarray(option_type, dtype=str)) == "C"
+    # immediate expiry => intrinsic (dummy T/sigma there, masked out below)
+    live = np.asarray(T) > 0
+    T_ = np.where(live, T, 1.0)
+    sigma_ = np.where(live, sigma, 1.0)
+    sqrtT = np.sqrt(T_)
+    disc = np.exp(-r*T_)
+    d1 = (np.log(S/K) + (r + 0.5*sigma_*sigma_)*T_) / (sigma_*sqrtT)
+    d2 = d1 - sigma_*sqrtT
+    price = np.where(is_call,
+                     S*ndtr(d1) - K*disc*ndtr(d2),
+                     K*disc*ndtr(-d2) - S*ndtr(-d1))
+    intrinsic = np.where(is_call, np.maximum(S - K, 0.0), np.maximum(K - S, 0.0))
+    return np.where(live, price, intrinsic)[()]
 
-def extended_ssvi_slice(k, T, a0, a1, rho, eta):
-    theta_T = a0 + a1*T
-    part = (eta*k + rho)
-    return 0.5 * theta_T * (
-        1 + rho*(eta*k) + np.sqrt(part**2 + 4*(1-rho**2))
-    )
+@lru_cache(maxsize=64)
+def _spot(ticker: str, minute_key: int) -> float:
+    """
+    Last 1m close for 'ticker' from yfinance (NaN if none). 'minute_key' buckets
+    the wall clock so repeated lookups within the same minute hit the cache.
+    """
+    df_spot = yf.Ticker(ticker).history(period="1d", interval="1m")
+    return float(df_spot["Close"].iloc[-1]) if len(df_spot) > 0 else float("nan")
 
-def price_option(
-    strike: float,
-    expiry_date: str,
-    option_type: str="C",
+def fetch_spot(ticker: str="SPY") -> float:
+    return _spot(ticker, int(time.time() // 60))
+
+def price_options(
+    strikes,
+    expiry_dates,
+    option_types="C",
     spot: float=None,
     r: float=0.01,
     extended_ssvi_csv="extended_ssvi_params.csv"
-):
+) -> np.ndarray:
     """
-    1) Load the Extended SSVI global params from 'extended_ssvi_csv'.
-    2) Compute T_live = (expiry_date - today)/365.
-    3) If spot=None, fetch from yfinance (SPY).
-    4) Evaluate SSVI => implied vol => Black–Scholes => return price.
+    Vectorized price_option for a whole book: 'strikes', 'expiry_dates'
+    (YYYY-MM-DD) and 'option_types' broadcast against each other.
+    1) Load the Extended SSVI global params once.
+    2) Compute T_live = (expiry_date - today)/365 per option.
+    3) If spot=None, fetch from yfinance (SPY) once, cached per minute.
+    4) Evaluate SSVI => implied vol => Black–Scholes on whole arrays.
+    Expired options get their intrinsic value, degenerate SSVI variances 0.0.
     """
+    strikes, expiry_dates, option_types = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(strikes, dtype=np.float64)),
+        np.atleast_1d(np.asarray(expiry_dates, dtype=str)),
+        np.atleast_1d(np.char.upper(np.asarray(option_types, dtype=str))),
+    )
+
     # 1) load SSVI params
     df_params = pd.read_csv(extended_ssvi_csv)
     a0 = df_params["a0"].iloc[0]
@@ -50,46 +71,40 @@ def price_option(
     rho = df_params["rho"].iloc[0]
     eta = df_params["eta"].iloc[0]
 
-    # 2) compute T_live
-    today = datetime.now()
-    expiry_dt = datetime.strptime(expiry_date, "%Y-%m-%d")
-    days_to_expiry = (expiry_dt - today).days
-    T_live = max(days_to_expiry, 0)/365.0
-
-    # fallback if T_live < some small
-    if T_live <= 0:
-        # Option is effectively expired, payoff is intrinsic
-        if spot is None:
-            # fetch spot anyway
-            ticker = yf.Ticker("SPY")
-            df_spot = ticker.history(period="1d", interval="1m")
-            if len(df_spot)>0:
-                spot = df_spot["Close"].iloc[-1]
-            else:
-                spot= strike # fallback
-        return black_scholes_price(spot, strike, 0, r, 0, option_type=option_type)
+    # 2) compute T_live (a single datetime64 subtraction over the whole book)
+    expiries = expiry_dates.astype("datetime64[D]")
+    today = np.datetime64("today", "D")
+    T_live = np.maximum((expiries - today).astype("int64"), 0)/365.0
 
     # 3) if spot not given, fetch from yfinance
     if spot is None:
-        ticker = yf.Ticker("SPY")
-        df_spot = ticker.history(period="1d", interval="1m")
-        if len(df_spot) > 0:
-            spot = df_spot["Close"].iloc[-1]
-        else:
-            # fallback guess
-            spot = strike
+        spot = fetch_spot("SPY")
+    # fallback guess
+    S = strikes if np.isnan(spot) else np.full_like(strikes, spot)
+
+    # 4) Evaluate SSVI on the live options (dummy T=1 elsewhere, masked out below)
+    live = T_live > 0
+    T = np.where(live, T_live, 1.0)
+    k = np.log(strikes / S)
+    w_val = extended_ssvi_slice(k, T, a0, a1, rho, eta)
+    degenerate = live & (w_val <= 0)
+    sigma = np.sqrt(np.where(degenerate, 1.0, w_val) / T)
 
-    # 4) Evaluate SSVI
-    k = np.log(strike / spot)
-    w_val = extended_ssvi_slice(k, T_live, a0, a1, rho, eta)
-    if w_val <= 0:
-        # degenerate
-        return 0.0
-    sigma = sqrt(w_val / T_live)
+    # 5) price with BS (expired => intrinsic), degenerate variance => 0.0
+    bs_price = black_scholes_price(S, strikes, T_live, r, sigma, option_type=option_types)
+    return np.where(degenerate, 0.0, bs_price)
 
-    # 5) price with BS
-    bs_price = black_scholes_price(spot, strike, T_live, r, sigma, option_type=option_type)
-    return bs_price
+def price_option(
+    strike: float,
+    expiry_date: str,
+    option_type: str="C",
+    spot: float=None,
+    r: float=0.01,
+    extended_ssvi_csv="extended_ssvi_params.csv"
+):
+    """Scalar wrapper around price_options for a single strike/expiry."""
+    return float(price_options(strike, expiry_date, option_type, spot=spot, r=r,
+                               extended_ssvi_csv=extended_ssvi_csv)[0])
 
 def main():
     if len(sys.argv) < 3:
@@ -0,0 +1,87 @@
+# ssvi_core.py
+
+import math
+import numpy as np
+from numba import njit, prange, types
+
+###############################################################################
+# Extended SSVI param:
+#   w(k, T) = 0.5 * [theta(T)] * [1 + rho * (eta*k) + sqrt((eta*k+rho)^2 + 4(1-rho^2)) ]
+#   where theta(T) = a0 + a1*T,  a1 >= 0, a0>0,  rho in(-1,1), eta>0
+#
+# Every script evaluates the surface through this one compile unit.
+###############################################################################
+
+# The kernels below are compiled eagerly from explicit signatures (no type
+# inference at first call) and cached on disk in the __pycache__ directory next
+# to this file, so later runs skip LLVM entirely. Numba invalidates the cache
+# when this file changes; if a kernel ever looks stale after editing the
+# formula, delete __pycache__/ssvi_core.*.nbi / *.nbc to force a recompile.
+_f8 = types.float64
+_f8_1d = types.float64[:]
+SLICE_SCALAR_SIG = _f8(_f8, _f8, _f8, _f8, _f8, _f8)
+SLICE_VEC_SIG = _f8_1d(_f8_1d, _f8_1d, _f8, _f8, _f8, _f8)
+RESIDUAL_AND_JAC_SIG = types.Tuple((_f8_1d, types.float64[:, :]))(
+    _f8_1d, _f8_1d, _f8_1d, _f8, _f8, _f8, _f8
+)
+
+@njit(SLICE_SCALAR_SIG, fastmath=True, cache=True)
+def slice_scalar(k, T, a0, a1, rho, eta):
+    """Total implied variance w(k, T) at a single point."""
+    ek = eta*k
+    part = ek + rho
+    c = 4.0 - 4.0*rho*rho
+    return 0.5*(a0 + a1*T)*(1.0 + rho*ek + math.sqrt(part*part + c))
+
+@njit(SLICE_VEC_SIG, parallel=True, fastmath=True, cache=True)
+def slice_vec(ks, Ts, a0, a1, rho, eta):
+    """Total implied variance w(k, T) over paired 1-D arrays ks/Ts."""
+    n = ks.shape[0]
+    out = np.empty(n)
+    for i in prange(n):
+        out[i] = slice_scalar(ks[i], Ts[i], a0, a1, rho, eta)
+    return out
+
+def extended_ssvi_slice(k, T, a0, a1, rho, eta):
+    """
+    Total implied variance w(k, T); k and T may be scalars or broadcastable
+    arrays. Scalars go to slice_scalar, anything else to slice_vec.
+    """
+    a0, a1, rho, eta = float(a0), float(a1), float(rho), float(eta)
+    if np.ndim(k) == 0 and np.ndim(T) == 0:
+        return slice_scalar(float(k), float(T), a0, a1, rho, eta)
+    k_b, T_b = np.broadcast_arrays(np.asarray(k, dtype=np.float64),
+                                   np.asarray(T, dtype=np.float64))
+    w = slice_vec(np.ascontiguousarray(k_b).ravel(), np.ascontiguousarray(T_b).ravel(),
+                  a0, a1, rho, eta)
+    return w.reshape(k_b.shape)
+
+@njit(RESIDUAL_AND_JAC_SIG, parallel=True, fastmath=True, cache=True)
+def residual_and_jac(ks, Ts, w, a0, a1, rho, eta):
+    """
+    w_model - w_market and its analytic Jacobian w.r.t. (a0, a1, rho, eta),
+    computed in a single fused pass over ks/Ts.
+
+      B = 1 + rho*eta*k + R,  R = sqrt((eta*k+rho)^2 + 4(1-rho^2))
+      dw/da0  = 0.5*B
+      dw/da1  = 0.5*T*B
+      dw/drho = 0.5*theta*(eta*k + (eta*k + rho - 4*rho)/R)
+      dw/deta = 0.5*theta*(rho*k + (eta*k + rho)*k/R)
+    """
+    n = ks.shape[0]
+    out = np.empty(n)
+    jac = np.empty((n, 4))
+    c = 4.0 - 4.0*rho*rho
+    for i in prange(n):
+        k = ks[i]
+        ek = eta*k
+        part = ek + rho
+        R = math.sqrt(part*part + c)
+        B = 1.0 + rho*ek + R
+        half_theta = 0.5*(a0 + a1*Ts[i])
+        out[i] = half_theta*B - w[i]
+        jac[i, 0] = 0.5*B
+        jac[i, 1] = 0.5*Ts[i]*B
+        jac[i, 2] = half_theta*(ek + (part - 4.0*rho)/R)
+        jac[i, 3] = half_theta*k*(rho + part/R)
+    return out, jac
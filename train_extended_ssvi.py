@@ -1,116 +1,177 @@
 # train_extended_ssvi.py
 
+import os
 import sys
+import multiprocessing
+from multiprocessing import shared_memory
+import numba
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 from scipy.optimize import least_squares
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
-
-###############################################################################
-# Extended SSVI param:
-#   w(k, T) = 0.5 * [theta(T)] * [1 + rho * (eta*k) + sqrt((eta*k+rho)^2 + 4(1-rho^2)) ]
-#   where theta(T) = a0 + a1*T,  a1 >= 0, a0>0,  rho in(-1,1), eta>0
-###############################################################################
-
-def extended_ssvi_slice(k, T, a0, a1, rho, eta):
-    theta_T = a0 + a1*T
-    part = (eta*k + rho)
-    return 0.5 * theta_T * (
-        1 + rho*(eta*k) + np.sqrt(part**2 + 4*(1-rho**2))
-    )
-
-def objective(params, ks, Ts, w_market):
-    a0, a1, rho, eta = params
-    w_model = extended_ssvi_slice(ks, Ts, a0, a1, rho, eta)
-    return w_model - w_market
-
-def train_extended_ssvi(cleaned_csv="options_cleaned.csv", out_csv="extended_ssvi_params.csv"):
-    # 1) Read cleaned data
+from ssvi_core import residual_and_jac
+
+# Parameter bounds for [a0, a1, rho, eta]
+LOWER_BOUNDS = [1e-6, 0.0, -0.999, 1e-6]
+UPPER_BOUNDS = [10.0, 10.0, 0.999, 100.0]
+
+# Columns of the cleaned data the calibration needs
+FIT_COLUMNS = ["iv", "strike", "underlying_last", "time_to_expiry_years"]
+
+# Explicit CSV column types, so a leading block with an all-empty column
+# can't make the reader infer the wrong type
+CSV_COLUMN_TYPES = {c: pa.float64() for c in FIT_COLUMNS} | {"option_type": pa.string()}
+
+# Upper bound on concurrent fit processes, independent of how many attempts run
+MAX_WORKERS = 8
+
+# Calibration arrays as views into the parent's shared-memory block, attached
+# once per worker process by _init_worker; _shm keeps the mapping alive
+_shm = None
+_ks = _Ts = _w_market = None
+
+def make_residuals_and_jac(ks, Ts, w_market):
+    """
+    Wraps the fused kernel as the (fun, jac) pair least_squares expects.
+    The Jacobian from the last fun(p) call is reused when jac is asked for the same p.
+    """
+    last = {"p": None, "jac": None}
+
+    def residuals(p):
+        res, jac = residual_and_jac(ks, Ts, w_market, p[0], p[1], p[2], p[3])
+        last["p"] = np.array(p, copy=True)
+        last["jac"] = jac
+        return res
+
+    def jacobian(p):
+        if last["p"] is None or not np.array_equal(p, last["p"]):
+            residuals(p)
+        return last["jac"]
+
+    return residuals, jacobian
+
+def _init_worker(shm_name, n):
+    global _shm, _ks, _Ts, _w_market
+    _shm = shared_memory.SharedMemory(name=shm_name)
+    _ks, _Ts, _w_market = np.ndarray((3, n), dtype=np.float64, buffer=_shm.buf)
+    # The attempts already run in parallel, so keep each kernel single-threaded
+    numba.set_num_threads(1)
+
+def _fit_attempt(init_params):
+    """Runs one least_squares fit from init_params; returns (x, cost)."""
+    residuals, jacobian = make_residuals_and_jac(_ks, _Ts, _w_market)
+    res = least_squares(residuals, init_params, jac=jacobian,
+                        bounds=(LOWER_BOUNDS, UPPER_BOUNDS),
+                        method="trf", x_scale="jac")
+    return res.x, res.cost
+
+def train_extended_ssvi(cleaned_csv="options_cleaned.parquet", out_csv="extended_ssvi_params.csv"):
+    # 1) Read cleaned data: the option_type filter and column projection are
+    #    pushed into the reader, so only call rows of the columns we fit on
+    #    are ever materialized
     print(f"Loading cleaned data from {cleaned_csv}...")
-    df = pd.read_csv(cleaned_csv, low_memory=False)
-
-    # 2) Filter to calls
-    df_calls = df[df["option_type"] == "C"].copy()
+    if cleaned_csv.endswith(".parquet"):
+        table = pq.read_table(cleaned_csv, columns=FIT_COLUMNS,
+                              filters=[("option_type", "=", "C")])
+    else:
+        csv_format = ds.CsvFileFormat(
+            convert_options=pacsv.ConvertOptions(column_types=CSV_COLUMN_TYPES))
+        table = ds.dataset(cleaned_csv, format=csv_format).to_table(
+            columns=FIT_COLUMNS, filter=ds.field("option_type") == "C")
+    df_calls = table.to_pandas()
+    del table
+
+    # 2) Drop unusable calls
     df_calls.dropna(subset=["iv", "strike", "underlying_last", "time_to_expiry_years"], inplace=True)
     df_calls = df_calls[df_calls["iv"] > 0]
 
-    # 3) Build arrays
-    #    If you have a huge dataset, you could do row-by-row with tqdm:
-    #    But if it's not massive, a vectorized approach is usually instant.
-    #    We'll show a small example:
-    T_list = []
-    k_list = []
-    w_list = []
-
+    # 3) Build arrays (vectorized over the underlying ndarrays). The cleaned
+    #    columns may be float32; the fit runs in float64, and w = iv^2 * T in
+    #    particular is formed from explicitly upcast inputs.
     print("Converting data to arrays...")
-    for idx, row in tqdm(df_calls.iterrows(), total=len(df_calls), desc="Building arrays"):
-        T = row["time_to_expiry_years"]
-        S = row["underlying_last"]
-        K = row["strike"]
-        iv = row["iv"]
-        if iv <= 0 or S<=0 or K<=0 or T<=0:
-            continue
-        w = iv**2 * T
-        k = np.log(K/S)
-        w_list.append(w)
-        k_list.append(k)
-        T_list.append(T)
-
-    ks = np.array(k_list)
-    Ts = np.array(T_list)
-    w_market = np.array(w_list)
+    T = df_calls["time_to_expiry_years"].to_numpy(dtype=np.float64)
+    S = df_calls["underlying_last"].to_numpy(dtype=np.float64)
+    K = df_calls["strike"].to_numpy(dtype=np.float64)
+    iv = df_calls["iv"].to_numpy(dtype=np.float64)
+    mask = (iv > 0) & (S > 0) & (K > 0) & (T > 0)
+    T, S, K, iv = T[mask], S[mask], K[mask], iv[mask]
+
+    w_market = iv * iv * T
+    ks = np.log(K / S)
+    Ts = T
     print(f"Final dataset size: {len(w_market)} implied vol points")
 
-    # 4) We'll do a multi-start approach, so we can show a progress bar
-    #    for each random initial guess. This is optional but can help if we suspect local minima.
-    N_ATTEMPTS = 3
-    best_res = None
+    # 4) We'll do a multi-start approach, one independent fit per core, and show
+    #    a progress bar as attempts finish. This can help if we suspect local minima.
+    N_ATTEMPTS = max(3, os.cpu_count() or 1)
+    n_workers = min(N_ATTEMPTS, os.cpu_count() or 1, MAX_WORKERS)
+    best_x = None
     best_cost = 1e15
 
-    print("Fitting extended SSVI with multiple initial guesses...")
-    attempts = []
-    for i in tqdm(range(N_ATTEMPTS), desc="Global SSVI fit attempts"):
-        # random-ish initial guesses
-        a0_init = np.random.uniform(0.001, 1.0) * np.mean(w_market)
-        a1_init = np.random.uniform(0, 1.0)
-        rho_init= np.random.uniform(-0.95, 0.95)
-        eta_init= np.random.uniform(0.1, 5.0)
-
-        init_params = np.array([a0_init, a1_init, rho_init, eta_init])
-        lb = [1e-6, 0.0, -0.999, 1e-6]
-        ub = [10.0, 10.0, 0.999, 100.0]
-
-        def residuals(p):
-            return objective(p, ks, Ts, w_market)
-
-        res = least_squares(residuals, init_params, bounds=(lb,ub))
-        cost = res.cost
-        if cost < best_cost:
-            best_cost = cost
-            best_res = res
-        
-        attempts.append((res.x, cost))
-    
-    # best_res should hold the best solution
-    a0_fit, a1_fit, rho_fit, eta_fit = best_res.x
+    # random-ish initial guesses
+    inits = [
+        np.array([
+            np.random.uniform(0.001, 1.0) * np.mean(w_market),
+            np.random.uniform(0, 1.0),
+            np.random.uniform(-0.95, 0.95),
+            np.random.uniform(0.1, 5.0),
+        ])
+        for _ in range(N_ATTEMPTS)
+    ]
+
+    # The arrays go into one shared-memory block that every worker maps, so
+    # they exist once no matter how many workers run
+    n = len(w_market)
+    shm = shared_memory.SharedMemory(create=True, size=3 * n * np.dtype(np.float64).itemsize)
+    try:
+        shared = np.ndarray((3, n), dtype=np.float64, buffer=shm.buf)
+        shared[0], shared[1], shared[2] = ks, Ts, w_market
+        del shared
+
+        print("Fitting extended SSVI with multiple initial guesses...")
+        attempts = []
+        # Workers are spawned, not forked: forking after the parallel numba kernels
+        # have been compiled leaves numba's TBB threading layer hanging at exit
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                 initargs=(shm.name, n),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(_fit_attempt, init_params) for init_params in inits]
+            for fut in tqdm(as_completed(futures), total=N_ATTEMPTS, desc="Global SSVI fit attempts"):
+                x, cost = fut.result()
+                if cost < best_cost:
+                    best_cost = cost
+                    best_x = x
+
+                attempts.append((x, cost))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    # best_x should hold the best solution
+    a0_fit, a1_fit, rho_fit, eta_fit = best_x
     results = {
         "a0": a0_fit,
         "a1": a1_fit,
         "rho": rho_fit,
         "eta": eta_fit,
-        "residual": best_res.cost,
+        "residual": best_cost,
         "num_points": len(w_market)
     }
 
     # Save to CSV
     df_out = pd.DataFrame([results])
     df_out.to_csv(out_csv, index=False)
-    print(f"\nExtended SSVI calibration done. Best cost={best_res.cost:.4f}")
+    print(f"\nExtended SSVI calibration done. Best cost={best_cost:.4f}")
     print(f"Saved params to {out_csv}")
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python train_extended_ssvi.py <options_cleaned.csv> [<out_params.csv>]")
+        print("Usage: python train_extended_ssvi.py <options_cleaned.parquet|.csv> [<out_params.csv>]")
         sys.exit(1)
     in_csv = sys.argv[1]
     out_csv = sys.argv[2] if len(sys.argv) > 2 else "extended_ssvi_params.csv"
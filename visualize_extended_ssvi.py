@@ -4,13 +4,7 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D  # needed for 3D plotting
-
-def extended_ssvi_slice(k, T, a0, a1, rho, eta):
-    theta_T = a0 + a1*T
-    part = (eta*k + rho)
-    return 0.5 * theta_T * (
-        1 + rho*(eta*k) + np.sqrt(part**2 + 4*(1-rho**2))
-    )
+from ssvi_core import extended_ssvi_slice
 
 def main():
     # Load the fitted extended SSVI params
@@ -23,9 +17,9 @@ def main():
 
     plt.figure(figsize=(8,5))
     for T in T_slices:
-        w_vals = [extended_ssvi_slice(k, T, a0, a1, rho, eta) for k in k_grid]
+        w_vals = extended_ssvi_slice(k_grid, T, a0, a1, rho, eta)
         # implied vol = sqrt(w / T)
-        iv_vals = [np.sqrt(w/T) for w in w_vals]
+        iv_vals = np.sqrt(w_vals / T)
         plt.plot(k_grid, iv_vals, label=f"T={T}y")
 
     plt.title("Extended SSVI: Implied Vol slices")